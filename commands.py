@@ -1,8 +1,11 @@
 from util import *
-import argparse
+from itertools import islice
 from urllib.error import HTTPError
 
 def build_parser():
+    # Imported here so commands that skip the parser don't pay for it
+    import argparse
+
     parser = argparse.ArgumentParser(description='Manage go installation')
     # Subparser for each command
     subparsers = parser.add_subparsers(dest='cmd')
@@ -36,7 +39,7 @@ def build_parser():
 def status_command():
     version = get_installed_go_version()
     if version:
-        print(get_installed_go_version())
+        print(version)
     else:
         print('Could not find a valid go installation')
 
@@ -52,6 +55,10 @@ def update_command(allow_preview):
         update_go_version(allow_preview)
     except PermissionError as e:
         print('Failed. Need privileged permission.')
+    except HTTPError as e:
+        print(e)
+    except RuntimeError as e:
+        print(e)
 
 def install_command(install_path, version, allow_preview):
     try:
@@ -66,12 +73,11 @@ def install_command(install_path, version, allow_preview):
 def available_command(count):
     releases = get_go_releases()
     if releases:
-        total = len(releases)
         list_size = 10
         if count:
-            list_size = int(count)
-        for release in releases[:total - list_size - 1:-1]:
-            print(release)
+            list_size = max(int(count), 0)
+        if list_size:
+            print('\n'.join(islice(reversed(releases), list_size)))
 
 def uninstall_command():
     print('Removing go installation...')
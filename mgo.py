@@ -1,7 +1,18 @@
 #!/usr/bin/python3
 from commands import *
+import sys
+
+# Commands that take no arguments can run without building the parser
+simpleCommands = {
+    'status': status_command,
+    'uninstall': uninstall_command
+}
 
 def run():
+    if len(sys.argv) == 2 and sys.argv[1] in simpleCommands:
+        simpleCommands[sys.argv[1]]()
+        return
+
     parser = build_parser()
 
     # Execute commands
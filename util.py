@@ -1,4 +1,9 @@
 from urllib import request
+from urllib.error import HTTPError
+from collections import namedtuple
+import errno
+import functools
+import hashlib
 import os
 import platform
 import json
@@ -27,100 +32,214 @@ extensionMap = {
     'darwin': '.pkg'
 }
 
+# Platform details used to pick release files. None if the platform has no go release.
+SYSTEM = platform.system().lower()
+ARCH = archMap.get(platform.machine())
+EXTENSION = extensionMap.get(SYSTEM)
+
+# Github responses are cached here and revalidated using their ETag
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mgo')
+RELEASES_CACHE_FILE = os.path.join(CACHE_DIR, 'releases.json')
+RELEASES_ETAG_FILE = os.path.join(CACHE_DIR, 'releases.etag')
+
+# Release archives are read from the network in blocks of this size
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
+# Last percentage shown by progress_report
+last_progress = -1
+
+# Matches the version reported by `go version`, like go1.22.3, go1.21rc1 or go1.20beta2
+_GO_VERSION_RE = re.compile(r'go(\d+)\.(\d+)\.?(\d+)?(\w+)?')
+
+VersionInfo = namedtuple('VersionInfo', ['version', 'major', 'minor', 'patch', 'is_beta', 'is_release_candidate'])
+
 # Runs a go subprocess and get the installed version
+# The result is cached, call get_installed_go_version.cache_clear() after changing the installation
+@functools.lru_cache(maxsize=None)
 def get_installed_go_version():
     out = subprocess.run(['go','version'], capture_output=True).stdout
-    result = re.search('go(\d+)\.(\d+)\.?(\d+)?(\w+)*', out.decode('utf-8'))
+    result = _GO_VERSION_RE.search(out.decode('utf-8'))
     if result:
         return result[0]
 
+# Returns the cached Github response body and its ETag or (None, None) if there is no cache
+def read_releases_cache():
+    try:
+        with open(RELEASES_CACHE_FILE, 'rb') as cache_file:
+            body = cache_file.read()
+        with open(RELEASES_ETAG_FILE, 'r') as etag_file:
+            etag = etag_file.read()
+        return body, etag
+    except OSError:
+        return None, None
+
+# Stores the Github response body and its ETag. Failing to write the cache is not an error.
+def write_releases_cache(body, etag):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(RELEASES_CACHE_FILE, 'wb') as cache_file:
+            cache_file.write(body)
+        with open(RELEASES_ETAG_FILE, 'w') as etag_file:
+            etag_file.write(etag)
+    except OSError:
+        pass
+
+# Decodes JSON with orjson when it is installed
+# Imported here so commands that don't read JSON don't pay for it
+def json_loads(data):
+    try:
+        from orjson import loads
+    except ImportError:
+        loads = json.loads
+    return loads(data)
+
+# Removes the cached Github response
+def remove_releases_cache():
+    for cache_file in (RELEASES_CACHE_FILE, RELEASES_ETAG_FILE):
+        try:
+            os.remove(cache_file)
+        except OSError:
+            pass
+
+# Requests the go tags from Github api and returns the response body
+# If cached_body is given it is revalidated with etag and returned when Github reports no change
+def request_releases(cached_body=None, etag=None):
+    URL = 'https://api.github.com/repos/golang/go/git/matching-refs/tags/go'
+    req = request.Request(URL)
+    if cached_body is not None and etag:
+        req.add_header('If-None-Match', etag)
+    try:
+        with request.urlopen(req) as resp:
+            body = resp.read()
+            etag = resp.headers['ETag']
+    except HTTPError as e:
+        e.close()
+        # 304 Not Modified means the cached body is still valid
+        if e.code == 304 and cached_body is not None:
+            return cached_body
+        raise
+    if etag:
+        write_releases_cache(body, etag)
+    return body
+
 # Get a list of go releases using Github api
+# The response is cached on disk and only downloaded again when Github reports a change
+@functools.lru_cache(maxsize=None)
 def get_go_releases():
-    URL = 'https://api.github.com/repos/golang/go/git/matching-refs/tags/go'
-    req = request.urlopen(URL)
-    jsonResponse = json.loads(req.read())
-    tagCount = len(jsonResponse)
-    if tagCount > 0:
-        releases = [jsonResponse[x]['ref'] for x in range(tagCount)]
-        releases = [x[x.rindex('/')+1:] for x in releases]
-        return releases
+    cached_body, etag = read_releases_cache()
+    body = request_releases(cached_body, etag)
+    try:
+        jsonResponse = json_loads(body)
+    except ValueError:
+        if body is not cached_body:
+            raise
+        # The cached copy is corrupt, drop it and download the releases again
+        remove_releases_cache()
+        jsonResponse = json_loads(request_releases())
+    if jsonResponse:
+        return [entry['ref'].rpartition('/')[2] for entry in jsonResponse]
 
 # Returns the latest go version string available
 # If allow_preview is True include betas and release candidates
 def get_go_release(allow_preview=False):
     releases = get_go_releases()
     if releases:
-        for version in releases[::-1]:
-            ver_info = parse_version(version)
-            if ver_info['is_beta'] or ver_info['is_release_candidate']:
-                if allow_preview:
-                    return version
-            else:
-                return version
+        candidates = [ver for ver in releases
+                      if (allow_preview or not is_preview_version(ver)) and parse_version(ver)]
+        return latest_version(candidates)
 
-# Returns a dictionary with fields version, major, minor, patch, is_beta and is_release_candidate
+# Returns True if the version string is a beta or release candidate
+# Cheaper than parse_version when only the preview status is needed
+def is_preview_version(ver):
+    return 'beta' in ver or 'rc' in ver
+
+# Returns a VersionInfo with fields version, major, minor, patch, is_beta and is_release_candidate
+# Accepts versions with or without the go prefix. Returns None if ver is not a valid version.
+# Results are cached since the same versions get parsed repeatedly
+@functools.lru_cache(maxsize=None)
 def parse_version(ver):
-    matches = re.search('(\d+)\.(\d+)\.?(\d+)?(\w+)*', ver)
-    if matches:
-        version = matches[0]
-        major = matches[1]
-        minor = matches[2]
-        patch = matches[3] or 0
-        beta = None
-        release_candidate = None
-        if matches[4]:
-            beta = True if matches[4].find('beta') >= 0 else False
-            release_candidate = True if matches[4].find('rc') >= 0 else False
-        return {
-            'version': version,
-            'major': int(major),
-            'minor': int(minor),
-            'patch': int(patch),
-            'is_beta': beta,
-            'is_release_candidate': release_candidate
-        }
+    version = ver[2:] if ver.startswith('go') else ver
+    parts = version.split('.', 2)
+    if len(parts) < 2:
+        return None
+    major, rest = split_digits(parts[0])
+    minor, suffix = split_digits(parts[1])
+    if not major or rest or not minor:
+        return None
+    patch = None
+    if not suffix and len(parts) == 3:
+        patch, suffix = split_digits(parts[2])
+    return VersionInfo(
+        version=version,
+        major=int(major),
+        minor=int(minor),
+        patch=int(patch or 0),
+        is_beta='beta' in suffix,
+        is_release_candidate='rc' in suffix
+    )
+
+# Splits a string into its leading digits and whatever comes after them
+def split_digits(text):
+    rest = text.lstrip('0123456789')
+    return text[:len(text) - len(rest)], rest
 
 # Returns 0 if ver1 and ver2 match
 # Returns a positive number if ver1 is newer than ver2
 # Returns a negative number if ver2 is newer than ver1
 def compare_versions(ver_info1, ver_info2):
-    result = 0
-    result += 100000 * (ver_info1['major'] - ver_info2['major'])
-    result += 10 * (ver_info1['minor'] - ver_info2['minor'])
-    result += ver_info1['patch'] - ver_info2['patch']
-    if ver_info1['is_beta']: result -= 1
-    if ver_info1['is_release_candidate']: result -= 2
-    if ver_info2['is_beta']: result += 1
-    if ver_info2['is_release_candidate']: result += 2
-    return result
+    key1 = version_key(ver_info1)
+    key2 = version_key(ver_info2)
+    return (key1 > key2) - (key1 < key2)
+
+# Returns a tuple that sorts versions from oldest to newest
+# Betas come before release candidates which come before the stable release
+def version_key(ver_info):
+    if ver_info.is_beta:
+        preview_rank = -2
+    elif ver_info.is_release_candidate:
+        preview_rank = -1
+    else:
+        preview_rank = 0
+    return (ver_info.major, ver_info.minor, ver_info.patch, preview_rank)
+
+# Returns the newest version in a list of valid version strings or None if the list is empty
+# Github lists tags by name (go1.9 after go1.25), so the order of the list doesn't matter
+def latest_version(versions):
+    return max(versions, key=lambda ver: version_key(parse_version(ver)), default=None)
 
 # Returns True if ver2 is newer than ver1. Returns False otherwise.
 # If allow_preview is True release canditates and betas will count as valid
 # to replace ver1.
 def should_update(ver1, ver2, allow_preview=False):
+    # Rejecting previews first avoids parsing them at all
+    if not allow_preview and is_preview_version(ver2):
+        return False
     ver_info1 = parse_version(ver1)
     ver_info2 = parse_version(ver2)
-    result = compare_versions(ver_info1, ver_info2)
-    if result < 0:
-        is_preview = ver_info2['is_beta'] or ver_info2['is_release_candidate']
-        if is_preview:
-            return allow_preview
-        else:
-            return True
-    return False
+    # Tags like go1 are not valid versions
+    if not ver_info1 or not ver_info2:
+        return False
+    return compare_versions(ver_info1, ver_info2) < 0
 
 def get_update_version(allow_preview):
+    # Imported here so commands that don't check for updates don't pay for it
+    from concurrent.futures import ThreadPoolExecutor
+
     try:
-        installed_version = get_installed_go_version()
-        releases = get_go_releases()
+        # Query the local go binary while waiting on the Github request
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            installed_future = executor.submit(get_installed_go_version)
+            releases_future = executor.submit(get_go_releases)
+            installed_version = installed_future.result()
+            releases = releases_future.result()
+
+        if not installed_version:
+            print('Could not get installed go version')
+            return
 
-        # Compute only later versions
-        index = releases.index(installed_version)
-        candidates = releases[index+1:]
         # Find latest version that is a suitable replacement
-        for candidate in candidates[::-1]:
-            if should_update(installed_version, candidate, allow_preview):
-                return candidate
+        candidates = [ver for ver in releases if should_update(installed_version, ver, allow_preview)]
+        return latest_version(candidates)
     except json.JSONDecodeError as e:
         print('Could not get release info from Github')
     except subprocess.CalledProcessError as e:
@@ -129,49 +248,128 @@ def get_update_version(allow_preview):
         print('Error interpreting go version scheme')
 
 def build_release_file_name(version):
-    system = platform.system().lower()
-    arch = archMap[platform.machine()]
-    extension = extensionMap[system]
-    version = version if version.find('go') == 0 else 'go' + version
-    name = version + '.' + system + '-' + arch + extension
-    return name
+    if not ARCH or not EXTENSION:
+        raise RuntimeError('Unsupported platform ' + SYSTEM + '-' + platform.machine())
+    version = version if version.startswith('go') else 'go' + version
+    return version + '.' + SYSTEM + '-' + ARCH + EXTENSION
+
+# Returns the expected sha256 of a release file as published on go.dev
+# Only current releases are listed by default so the full list is a fallback
+def get_release_checksum(name):
+    for url in ('https://go.dev/dl/?mode=json', 'https://go.dev/dl/?mode=json&include=all'):
+        with request.urlopen(url) as resp:
+            releases = json_loads(resp.read())
+        for release in releases:
+            for release_file in release['files']:
+                if release_file['filename'] == name:
+                    return release_file['sha256']
+    raise RuntimeError('Could not find checksum for ' + name)
 
 # Donwload file and show progress report
+# The file is hashed while it is written and removed if it does not match the published checksum
 def donwload_file(name):
-    request.urlretrieve(
-        'https://go.dev/dl/' + name,
-        name,
-        progress_report
-    )
+    global last_progress
+    last_progress = -1
+    expected_checksum = get_release_checksum(name)
+    checksum = hashlib.sha256()
+    with request.urlopen('https://go.dev/dl/' + name) as resp, open(name, 'wb') as out_file:
+        total_size = int(resp.headers.get('Content-Length', -1))
+        count = 0
+        while True:
+            block = resp.read(DOWNLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            out_file.write(block)
+            checksum.update(block)
+            count += 1
+            progress_report(count, DOWNLOAD_BLOCK_SIZE, total_size)
     print() # New line after donwload is finished
+    if checksum.hexdigest() != expected_checksum:
+        os.remove(name)
+        raise RuntimeError('Checksum mismatch for ' + name)
+
+# Returns the directory of the go installation on PATH or None if there isn't one
+# Only <parent>/go/bin/go layouts of a go distribution are accepted. The VERSION file
+# tells a distribution apart from a GOPATH that is also named go.
+def find_installation():
+    go_binary = shutil.which('go')
+    if not go_binary:
+        return None
+    go_binary = os.path.realpath(go_binary)
+    bin_location = os.path.dirname(go_binary)
+    go_location = os.path.dirname(bin_location)
+    if (os.path.normcase(os.path.basename(go_binary)) in ('go', 'go.exe')
+            and os.path.normcase(os.path.basename(bin_location)) == 'bin'
+            and os.path.normcase(os.path.basename(go_location)) == 'go'
+            and os.path.isfile(os.path.join(go_location, 'VERSION'))):
+        return go_location
 
 # Remove current go installtion
+# Returns the directory that contained it or None if go was not found
 def remove_installation():
-    go_location = shutil.which('go')
+    go_location = find_installation()
     if go_location:
-        go_location = go_location[:go_location.rindex(os.sep + 'bin')]
-        parent_location = go_location[:go_location.rindex(os.sep + 'go')]
-        if go_location:
-            shutil.rmtree(go_location)
-        return parent_location
+        remove_directory(go_location)
+        get_installed_go_version.cache_clear()
+        return os.path.dirname(go_location)
+
+# Remove a directory tree using rm when available since it is faster than
+# shutil.rmtree on large trees. Write access is checked first so a missing
+# permission raises PermissionError before anything is deleted.
+def remove_directory(path):
+    for location in (os.path.dirname(path), path):
+        if not os.access(location, os.W_OK):
+            raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), location)
+    if os.name != 'nt' and shutil.which('rm'):
+        result = subprocess.run(['rm', '-rf', '--', path], stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError('Failed to remove ' + path + ': ' + result.stderr.decode('utf-8', 'replace').strip())
+    else:
+        shutil.rmtree(path)
 
 def extract_file(name, location):
     if name.endswith('.tar.gz'):
-        compressed_file = tarfile.open(name, mode='r:gz')
-        compressed_file.extractall(path=location)
+        extract_targz(name, location)
     elif name.endswith('.zip'):
         compressed_file = zipfile.ZipFile(name)
         compressed_file.extractall(path=location)
 
+# Extract a .tar.gz file using tar with pigz (multithreaded gzip) when both are available
+def extract_targz(name, location):
+    if shutil.which('tar') and shutil.which('pigz'):
+        result = subprocess.run(['tar', '--use-compress-program=pigz', '-xf', name, '-C', location], stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError('Failed to extract ' + name + ': ' + result.stderr.decode('utf-8', 'replace').strip())
+    else:
+        # Stream mode reads members one at a time instead of loading the whole index first
+        with tarfile.open(name, mode='r|gz') as compressed_file:
+            if hasattr(tarfile, 'data_filter'):
+                compressed_file.extractall(path=location, filter='data')
+            else:
+                compressed_file.extractall(path=location)
 
+# Only prints when the percentage changes
 def progress_report(count, blocksize, totalsize):
-    print('\rProgress: ' + str(round((count * blocksize) * 100 / totalsize)) + '%', end='')
+    global last_progress
+    if totalsize <= 0:
+        return
+    downloaded = min(count * blocksize, totalsize)
+    progress = downloaded * 100 // totalsize
+    if progress != last_progress:
+        last_progress = progress
+        print('\rProgress: ' + str(progress) + '%', end='', flush=True)
 
 def update_go_version(allow_preview):
     # Check if there is an update available
     version = get_update_version(allow_preview)
     if version:
         print('Version ' + version + ' available')
+        # Find the installation before downloading anything
+        go_location = find_installation()
+        if not go_location:
+            print('Go not found')
+            return
+
         print('Downloading file...')
         # Build release name based on platform
         name = build_release_file_name(version)
@@ -181,15 +379,16 @@ def update_go_version(allow_preview):
 
         # Remove current installtion
         print('Removing current installation...')
-        go_location = remove_installation()
+        remove_directory(go_location)
 
         # Extract new version
         print('Extracting file...')
-        extract_file(name, go_location)
+        extract_file(name, os.path.dirname(go_location))
 
         # Remove downloaded file
         print('Removing temporary file...')
         os.remove(name)
+        get_installed_go_version.cache_clear()
 
         print('Go version updated')
     else:
@@ -220,6 +419,7 @@ def install_go_version(install_path, version, allow_preview):
         # Remove downloaded file
         print('Removing temporary file...')
         os.remove(name)
+        get_installed_go_version.cache_clear()
         print('Installation complete')
         bin_path = os.path.abspath(install_path + os.sep + 'go' + os.sep + 'bin')
         print('Make sure ' + bin_path + ' is on your PATH')
\ No newline at end of file